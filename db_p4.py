@@ -1,130 +1,521 @@
+import io
 import os
 import json
+import multiprocessing
+import hashlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 import chromadb
+import chromadb.errors
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-from pdfminer.high_level import extract_text
-from sentence_transformers import SentenceTransformer
-import textwrap
+from pdfminer.high_level import extract_text_to_fp
+from pdfminer.layout import LAParams
 
-# Initialize ChromaDB client **only once**
-client = chromadb.PersistentClient(path="p4_vector_db")
-collection = client.get_or_create_collection("p4_documents")
+# ChromaDB client, collection and embedding model are created on first use, so importing
+# this module (e.g. just for retrieve_documents) stays cheap; see get_collection()
+_client = None
+_collection = None
+_embedding_model = None
 
-# Load the embedding model once
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# Lazily loaded, incrementally updated views of the collection; see get_existing_ids()
+_EXISTING_IDS = None
+_EXISTING_FILES = None
+
+# Maps sha256(pdf bytes) -> filename for PDFs that were fully ingested
+INGEST_CACHE_PATH = os.path.join("p4_vector_db", "ingest_cache.json")
+
+# Content-addressed embedding cache, so rebuilds skip the model forward pass
+EMBEDDING_CACHE_PATH = os.path.join("p4_vector_db", "emb_cache.sqlite")
+
+# Reuse one HTTP session so downloads and GitHub API calls share pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=Retry(total=3, backoff_factor=0.5)))
+
+# 3-layer MiniLM: same 384-dim output as all-MiniLM-L6-v2 at half the encoder depth.
+# Vectors from different models are not comparable; get_collection() refuses a mismatched DB.
+EMBEDDING_MODEL_NAME = "paraphrase-MiniLM-L3-v2"
+
+# Small corpus: a sparser graph builds faster, and a wider search beam recovers recall.
+# Embeddings are L2-normalized, so cosine distance matches the model's similarity.
+HNSW_SETTINGS = {"hnsw:space": "cosine", "hnsw:M": 8, "hnsw:construction_ef": 64, "hnsw:search_ef": 32}
+
+# Stored on the collection so a DB built with another model or metric is detected on open
+COLLECTION_METADATA = {**HNSW_SETTINGS, "embedding_model": EMBEDDING_MODEL_NAME}
+
+# Prefix for embedding-cache keys; together with the precision added in get_or_embed() it
+# covers everything that changes the stored vectors, so bump it whenever the encode settings
+# change and old cache entries stop matching
+EMBEDDING_CACHE_TAG = f"{EMBEDDING_MODEL_NAME}|norm=1"
+
+def get_collection():
+    """Returns the ChromaDB collection, initializing the client **only once**."""
+    global _client, _collection
+    if _collection is None:
+        client = chromadb.PersistentClient(path="p4_vector_db")
+        # get_or_create_collection may overwrite metadata on an existing collection,
+        # so open it first and only pass the metadata when creating it
+        try:
+            collection = client.get_collection("p4_documents")
+        except (ValueError, chromadb.errors.ChromaError):
+            collection = client.create_collection("p4_documents", metadata=COLLECTION_METADATA)
+        
+        metadata = collection.metadata or {}
+        if (metadata.get("embedding_model") != EMBEDDING_MODEL_NAME
+                or metadata.get("hnsw:space") != HNSW_SETTINGS["hnsw:space"]):
+            raise RuntimeError(
+                f"p4_vector_db was built with embedding_model={metadata.get('embedding_model')!r}, "
+                f"hnsw:space={metadata.get('hnsw:space')!r} but this code uses {EMBEDDING_MODEL_NAME!r}, "
+                f"{HNSW_SETTINGS['hnsw:space']!r}. Delete the p4_vector_db directory and rebuild it."
+            )
+        _client, _collection = client, collection
+    return _collection
+
+@lru_cache(maxsize=None)
+def _embedding_device():
+    """Returns the device the embedding model runs on; the model is FP16 on cuda, FP32 otherwise."""
+    # Imported here so importing this module does not pay for torch
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def get_embedding_model():
+    """Returns the embedding model, loading it once on first use."""
+    global _embedding_model
+    if _embedding_model is None:
+        # Imported here so importing this module does not pay for torch
+        import torch
+        from sentence_transformers import SentenceTransformer
+        device = _embedding_device()
+        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+        if device == "cuda":
+            _embedding_model.half()  # FP16 halves tensor bytes and uses tensor cores
+        else:
+            torch.set_num_threads(os.cpu_count() or 1)
+    return _embedding_model
 
 def get_embedding(text):
     """Generates an embedding for the given text."""
-    return embedding_model.encode(text).tolist()
+    return get_embedding_model().encode(text, normalize_embeddings=True).tolist()
+
+@lru_cache(maxsize=1024)
+def _embed_query(text):
+    """Embeds a query string, memoized so repeated queries skip the model forward pass."""
+    return tuple(get_embedding(text))
+
+def get_embeddings(texts, batch_size=64):
+    """Generates L2-normalized embeddings for many texts at once, in the same order as `texts`.
+
+    Texts are presorted by length so each minibatch only pads to its own longest item.
+    """
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_embs = get_embedding_model().encode([texts[i] for i in order], batch_size=batch_size, show_progress_bar=False,
+                                               convert_to_numpy=True, normalize_embeddings=True)
+    embeddings = np.empty_like(sorted_embs)
+    embeddings[order] = sorted_embs
+    return embeddings
+
+def get_or_embed(texts):
+    """Returns embeddings for `texts`, encoding only those missing from the on-disk embedding cache.
+
+    Entries are keyed by sha1(f"{EMBEDDING_CACHE_TAG}|{precision}|{text}"), so rebuilding the collection
+    reuses earlier encodes while FP16 (cuda) and FP32 (cpu) vectors are never served to each other.
+    """
+    precision = "fp16" if _embedding_device() == "cuda" else "fp32"
+    keys = [hashlib.sha1(f"{EMBEDDING_CACHE_TAG}|{precision}|{t}".encode()).hexdigest() for t in texts]
+    os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(EMBEDDING_CACHE_PATH)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)")
+            vectors = {}
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                rows = conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+                vectors.update((key, np.frombuffer(vec, dtype=np.float32)) for key, vec in rows)
+            
+            missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+            if missing:
+                embeddings = get_embeddings(list(missing.values())).astype(np.float32)
+                conn.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                                 [(key, emb.tobytes()) for key, emb in zip(missing, embeddings)])
+                vectors.update(zip(missing, embeddings))
+    finally:
+        conn.close()
+    return np.stack([vectors[key] for key in keys])
+
+def extract_pdf_text(pdf_path):
+    """Extracts plain text from a PDF, streaming pdfminer's output into an in-memory buffer.
+
+    Uses the same default layout analysis as `extract_text`, so reading order is unchanged.
+    """
+    buf = io.StringIO()
+    with open(pdf_path, "rb") as f:
+        extract_text_to_fp(f, buf, laparams=LAParams(), output_type="text", codec=None)
+    return buf.getvalue()
 
 def chunk_text(text, chunk_size=512, min_chunk_size=100):
-    """Splits text into smaller chunks for better retrieval, ensuring meaningful chunks."""
-    chunks = textwrap.wrap(text, width=chunk_size)
-    return [chunk for chunk in chunks if len(chunk) > min_chunk_size]
+    """Splits text into fixed-size windows for better retrieval, ensuring meaningful chunks."""
+    text = " ".join(text.split())
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size) if len(text) - i > min_chunk_size]
+
+def add_in_batches(ids, documents, embeddings, metadatas, batch_size=200):
+    """Adds items to ChromaDB in bulk, slicing into batches to bound per-call size."""
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        get_collection().add(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=metadatas[start:end]
+        )
+
+def _load_cache():
+    """Loads the sha256 -> filename map of PDFs that were already ingested."""
+    if not os.path.exists(INGEST_CACHE_PATH):
+        return {}
+    with open(INGEST_CACHE_PATH) as f:
+        return json.load(f)
+
+def _save_cache(cache):
+    """Writes the ingest cache back next to the ChromaDB files."""
+    os.makedirs(os.path.dirname(INGEST_CACHE_PATH), exist_ok=True)
+    with open(INGEST_CACHE_PATH, "w") as f:
+        json.dump(cache, f, indent=2)
+
+def file_sha256(path):
+    """Returns the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_existing_ids(refresh=False):
+    """Returns the memoized set of chunk ids in the collection, loading it on first use."""
+    global _EXISTING_IDS
+    if _EXISTING_IDS is None or refresh:
+        _EXISTING_IDS = set(get_collection().get(include=[])["ids"])
+    return _EXISTING_IDS
+
+def get_existing_files(refresh=False):
+    """Returns the memoized set of filenames in the collection, loading it on first use."""
+    global _EXISTING_FILES
+    if _EXISTING_FILES is None or refresh:
+        _EXISTING_FILES = {meta["filename"] for meta in get_collection().get(include=["metadatas"])["metadatas"]}
+    return _EXISTING_FILES
+
+def _remember_files(filenames):
+    """Adds filenames to the memoized set, only if it is loaded, so adds never trigger a full scan."""
+    if _EXISTING_FILES is not None:
+        _EXISTING_FILES.update(filenames)
+
+@contextmanager
+def tune_sqlite_for_ingest():
+    """Relaxes SQLite durability on the Chroma client for the duration of a bulk ingest.
+
+    Unsafe if the process crashes mid-ingest; the DB can then be rebuilt from the source PDFs.
+    The previous pragmas are restored on exit so the exclusive lock does not outlive the ingest.
+    """
+    get_collection()
+    # Chroma does not expose its SQLite connection publicly, so reach into the client internals
+    sysdb = getattr(getattr(_client, "_server", _client), "_sysdb", None)
+    conn_pool = getattr(sysdb, "_conn_pool", None)
+    if conn_pool is None:
+        print("Could not access ChromaDB's SQLite connection. Using default pragmas.")
+        yield
+        return
+    conn = conn_pool.connect()
+    previous = {name: conn.execute(f"pragma {name}").fetchone()[0]
+                for name in ("journal_mode", "synchronous", "temp_store")}
+    for pragma in ("journal_mode=off", "synchronous=off", "temp_store=memory", "locking_mode=exclusive"):
+        conn.execute(f"pragma {pragma}")
+    try:
+        yield
+    finally:
+        # Release the lock before restoring journal_mode: once back in WAL mode an
+        # exclusive connection cannot return to normal locking.
+        # SQLite only drops the exclusive lock on the next access to the database file
+        conn.execute("pragma locking_mode=normal")
+        conn.execute("select count(*) from sqlite_master").fetchone()
+        for name, value in previous.items():
+            conn.execute(f"pragma {name}={value}")
 
 # Function to retrieve documents
 def retrieve_documents(query, top_k=3, file_type=None):
     """Retrieves documents based on query similarity with optional filtering."""
-    query_embedding = get_embedding(query)
-    results = collection.query(query_embeddings=[query_embedding], n_results=top_k)
+    query_embedding = list(_embed_query(query))
+    # Filter by metadata inside the search so top_k counts only matching documents
+    results = get_collection().query(
+        query_embeddings=[query_embedding],
+        n_results=top_k,
+        where={"file_type": file_type} if file_type else None
+    )
     
-    if file_type:
-        results["documents"] = [
-            doc for doc, meta in zip(results["documents"], results["metadatas"])
-            if meta.get("file_type") == file_type
-        ]
+    # One query embedding, so documents has shape [1][top_k]
+    return results["documents"][0] if results.get("documents") else []
+
+# Function to download a PDF
+def download_pdf(pdf_url, pdf_path):
+    """Streams a PDF to disk in fixed-size blocks. Returns False if the download failed.
+
+    The body goes to a `.part` file that replaces `pdf_path` only once complete, so a failed
+    download never truncates an existing copy or leaves a partial PDF behind.
+    """
+    part_path = pdf_path + ".part"
+    try:
+        with SESSION.get(pdf_url, stream=True, timeout=10) as response:
+            response.raise_for_status()
+            with open(part_path, "wb") as file:
+                for block in response.iter_content(1 << 16):
+                    file.write(block)
+        os.replace(part_path, pdf_path)
+        return True
+    except requests.RequestException as e:
+        print(f"Error downloading {pdf_path}: {e}")
+        return False
+    except OSError as e:
+        # Disk full, permissions, etc. while writing or replacing the file
+        print(f"Error saving {pdf_path}: {e}")
+        return False
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def _check_ingest_cache(pdf_path):
+    """Returns `(cache, file_hash)` for a PDF, or None if it is unchanged since its last ingest."""
+    cache = _load_cache()
+    file_hash = file_sha256(pdf_path)
+    if file_hash in cache:
+        print(f"{os.path.basename(pdf_path)} is unchanged since last ingest. Skipping extraction.")
+        return None
+    return cache, file_hash
+
+def _ingest_text(text, filename, metadata_fn, existing_ids, cache, file_hash):
+    """Chunks `text` and stores the chunks not yet in ChromaDB, then records the file in `cache`.
+
+    `metadata_fn(i, chunk_id)` builds each chunk's metadata. Returns the number of chunks added.
+    Saving `cache` is left to the caller, so a multi-file build writes it only once.
+    """
+    if existing_ids is None:
+        existing_ids = get_existing_ids()
+    
+    new_chunks = [(i, chunk_id, chunk) for i, chunk_id, chunk in
+                  ((i, f"{filename}-{i}", chunk) for i, chunk in enumerate(chunk_text(text)))
+                  if chunk_id not in existing_ids]
     
-    return results["documents"] if "documents" in results else []
+    if new_chunks:
+        # Encode all new chunks in one batched forward pass
+        texts = [chunk for _, _, chunk in new_chunks]
+        add_in_batches(
+            ids=[chunk_id for _, chunk_id, _ in new_chunks],
+            documents=texts,
+            embeddings=get_or_embed(texts).tolist(),
+            metadatas=[metadata_fn(i, chunk_id) for i, chunk_id, _ in new_chunks]
+        )
+        existing_ids.update(chunk_id for _, chunk_id, _ in new_chunks)
+        _remember_files([filename])
+    
+    cache[file_hash] = filename
+    return len(new_chunks)
 
 # Function to add a PDF to the database
-def add_pdf_to_database(pdf_url, pdf_filename):
-    """Downloads and adds a PDF in chunks to ChromaDB with deduplication."""
+def add_pdf_to_database(pdf_url, pdf_filename, existing_ids=None, downloaded=False):
+    """Downloads and adds a PDF in chunks to ChromaDB with deduplication.
+
+    `existing_ids` defaults to the memoized set from `get_existing_ids()`; it is updated in place.
+    Pass `downloaded=True` when the caller already fetched the file with `download_pdf`.
+    """
     pdf_path = pdf_filename
     
-    try:
-        response = requests.get(pdf_url, timeout=10)
-        response.raise_for_status()
-        with open(pdf_path, "wb") as file:
-            file.write(response.content)
+    if not downloaded and not download_pdf(pdf_url, pdf_path):
+        return
 
-        text = extract_text(pdf_path)
-        chunks = chunk_text(text)
-        
-        existing_ids = set(collection.get()["ids"])
-
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{pdf_filename}-{i}"
-            if chunk_id not in existing_ids:
-                collection.add(
-                    ids=[chunk_id],
-                    documents=[chunk],
-                    embeddings=[get_embedding(chunk)],
-                    metadatas=[{"filename": pdf_filename, "chunk": i, "repo_url": pdf_url}]
-                )
-        
-        print(f"{pdf_filename} successfully added to ChromaDB in chunks!")
-    except requests.RequestException as e:
-        print(f"Error downloading {pdf_filename}: {e}")
+    # Skip extraction and embedding entirely if the downloaded PDF is unchanged
+    cached = _check_ingest_cache(pdf_path)
+    if cached is None:
+        return
+
+    text = extract_pdf_text(pdf_path)
+    _ingest_text(text, pdf_filename, lambda i, _: {"filename": pdf_filename, "chunk": i, "repo_url": pdf_url},
+                 existing_ids, *cached)
+    _save_cache(cached[0])
+    print(f"{pdf_filename} successfully added to ChromaDB in chunks!")
+
+# Function to add a PDF that is already on disk
+def add_local_pdf_to_database(pdf_path, existing_ids=None, text=None, cached=None):
+    """Extracts text from a local PDF, chunks it, and stores only new chunks in ChromaDB.
+
+    `existing_ids` defaults to the memoized set from `get_existing_ids()`; it is updated in place.
+    Pass `text` when it was already extracted (e.g. in a worker process) to skip pdfminer here.
+    Pass `cached=(cache, file_hash)` when the caller already checked the ingest cache; the
+    caller then owns saving `cache`.
+    """
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF not found: {pdf_path}")
+    
+    base_filename = os.path.basename(pdf_path)
+    
+    # Skip extraction and embedding entirely for unchanged PDFs
+    save_cache = cached is None
+    if cached is None:
+        cached = _check_ingest_cache(pdf_path)
+        if cached is None:
+            return
+    
+    if text is None:
+        text = extract_pdf_text(pdf_path)
+    added = _ingest_text(text, base_filename,
+                         lambda _, chunk_id: {"filename": base_filename, "chunk": chunk_id, "file_path": pdf_path},
+                         existing_ids, *cached)
+    if save_cache:
+        _save_cache(cached[0])
+    
+    if added:
+        print(f"Added {added} new chunks from {base_filename} to ChromaDB!")
+    else:
+        print(f"All chunks from {base_filename} are already in the database. Skipping addition.")
 
 # Function to add exercises from P4 tutorials
-def add_p4_exercises():
+def add_p4_exercises(existing_ids=None):
     """Fetches and adds P4 exercises in chunks to the database using GitHub API with deduplication."""
     base_api_url = "https://api.github.com/repos/p4lang/tutorials/contents/exercises"
     try:
-        response = requests.get(base_api_url, timeout=10)
+        response = SESSION.get(base_api_url, timeout=10)
         response.raise_for_status()
         exercises = response.json()
         
-        existing_ids = set(collection.get()["ids"])
+        if existing_ids is None:
+            existing_ids = get_existing_ids()
         
+        # Collect new chunks across all exercises and flush them in bulk
+        ids, docs, metas, new_exercises = [], [], [], []
         for exercise in exercises:
             if exercise["type"] == "dir":
                 exercise_name = exercise["name"]
                 exercise_url = exercise["html_url"]
                 
-                # Fetch exercise details
+                # The text depends only on name and url, so a stored first chunk means nothing changed
+                if f"{exercise_name}-0" in existing_ids:
+                    continue
+                
                 exercise_content = f"Exercise: {exercise_name} located at {exercise_url}"
                 chunks = chunk_text(exercise_content)
+                # Texts at or under min_chunk_size yield no chunks and are never stored
+                if not chunks:
+                    continue
                 
                 for i, chunk in enumerate(chunks):
-                    chunk_id = f"{exercise_name}-{i}"
-                    if chunk_id not in existing_ids:
-                        collection.add(
-                            ids=[chunk_id],
-                            documents=[chunk],
-                            embeddings=[get_embedding(chunk)],
-                            metadatas=[{"filename": exercise_name, "file_type": "directory", "chunk": i, "repo_url": exercise_url}]
-                        )
+                    ids.append(f"{exercise_name}-{i}")
+                    docs.append(chunk)
+                    metas.append({"filename": exercise_name, "file_type": "directory", "chunk": i, "repo_url": exercise_url})
+                new_exercises.append(exercise_name)
+        
+        if ids:
+            embs = get_or_embed(docs).tolist()
+            add_in_batches(ids, docs, embs, metas)
+            existing_ids.update(ids)
+            _remember_files(new_exercises)
+            for exercise_name in new_exercises:
                 print(f"Added exercise: {exercise_name} in chunks.")
     except requests.RequestException as e:
         print(f"Error fetching exercises: {e}")
 
 # Function to check & add new documents only if needed
-def build_database():
-    """Ensures that ChromaDB only adds new documents and does not duplicate embeddings."""
-    existing_count = collection.count()
+def build_database(refresh=False):
+    """Ensures that ChromaDB only adds new documents and does not duplicate embeddings.
+
+    Pass `refresh=True` to reload the memoized ids from the collection first.
+    """
+    existing_count = get_collection().count()
     if existing_count > 0:
         print(f"Database already populated with {existing_count} documents. Checking for missing documents...")
     
-    # Add P4 Cheat Sheet
-    add_pdf_to_database("https://raw.githubusercontent.com/p4lang/tutorials/master/p4-cheat-sheet.pdf", "p4-cheat-sheet.pdf")
+    existing_ids = get_existing_ids(refresh)
+    
+    pdf_sources = [
+        # P4 Cheat Sheet
+        ("https://raw.githubusercontent.com/p4lang/tutorials/master/p4-cheat-sheet.pdf", "p4-cheat-sheet.pdf"),
+        # P4_16 Tutorial PDF
+        ("https://opennetworking.org/wp-content/uploads/2020/12/p4_d2_2017_p4_16_tutorial.pdf", "p4-16-tutorial.pdf"),
+    ]
+    
+    # Downloads are I/O-bound, so fetch them concurrently; ingest stays sequential
+    # because the ChromaDB adds and the ingest cache are not shared across threads.
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        downloaded = list(ex.map(lambda source: download_pdf(*source), pdf_sources))
+    
+    with tune_sqlite_for_ingest():
+        for (pdf_url, pdf_filename), ok in zip(pdf_sources, downloaded):
+            if ok:
+                add_pdf_to_database(pdf_url, pdf_filename, existing_ids, downloaded=True)
+        
+        # Add P4 Exercises
+        add_p4_exercises(existing_ids)
+    
+    print("Database update complete.")
+
+# Function to add the PDFs in the working directory
+def build_local_database(refresh=False):
+    """Ensures that ChromaDB only adds new local PDFs and does not skip processing if new files exist.
+
+    Pass `refresh=True` to reload the memoized ids and filenames from the collection first.
+    """
+    existing_files = get_existing_files(refresh)
+    
+    pdf_files = [f for f in os.listdir() if f.endswith(".pdf")]
+    
+    new_files = [f for f in pdf_files if f not in existing_files]
+    if not new_files:
+        print("No new PDF files found. Skipping addition.")
+        return
     
-    # Add P4_16 Tutorial PDF
-    add_pdf_to_database("https://opennetworking.org/wp-content/uploads/2020/12/p4_d2_2017_p4_16_tutorial.pdf", "p4-16-tutorial.pdf")
+    # Only unchanged PDFs are skipped; everything else goes through pdfminer.
+    # Each file is hashed once here and the hash is passed down with the loaded cache.
+    cache = _load_cache()
+    file_hashes = {f: file_sha256(f) for f in new_files}
+    to_extract = [f for f in new_files if file_hashes[f] not in cache]
     
-    # Add P4 Exercises
-    add_p4_exercises()
+    # pdfminer is CPU-bound, so extract in worker processes. The ChromaDB client is
+    # already open here and is not fork-safe, so spawn fresh workers (importing db_p4
+    # is cheap since the client and model are lazy) and keep chunking, embedding and
+    # adds on the main process.
+    extracted = []
+    if to_extract:
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4),
+                                 mp_context=multiprocessing.get_context("spawn")) as ex:
+            futures = [(pdf_file, ex.submit(extract_pdf_text, pdf_file)) for pdf_file in to_extract]
+            for pdf_file, future in futures:
+                # One unreadable PDF should not stop the others from being ingested
+                try:
+                    extracted.append((pdf_file, future.result()))
+                except Exception as e:
+                    print(f"Error extracting text from {pdf_file}: {e}. Skipping.")
+    
+    existing_ids = get_existing_ids(refresh)
+    try:
+        with tune_sqlite_for_ingest():
+            for pdf_file, text in extracted:
+                add_local_pdf_to_database(pdf_file, existing_ids, text=text, cached=(cache, file_hashes[pdf_file]))
+    finally:
+        # Write the ingest cache once, keeping entries for files that finished before any error
+        _save_cache(cache)
     
     print("Database update complete.")
 
 # **Only execute database build if running this script directly**
 if __name__ == "__main__":
-    if collection.count() > 0:
-        print(f"Database already exists with {collection.count()} documents. Skipping rebuild.")
+    if get_collection().count() > 0:
+        print(f"Database already exists with {get_collection().count()} documents. Skipping rebuild.")
     else:
         build_database()
 
 # Ensure functions are importable without triggering database rebuild
-__all__ = ["retrieve_documents"]
+__all__ = ["retrieve_documents", "add_local_pdf_to_database", "build_local_database"]
 
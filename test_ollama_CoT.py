@@ -11,14 +11,7 @@ def sanitize_filename(query):
 
 def generate_response(query, model_name=""):
     """Retrieves relevant documents and generates a response using Ollama with Chain of Thought reasoning."""
-    relevant_docs = retrieve_documents(query, top_k=3)
-
-    # Handle incorrect data types
-    if any(isinstance(doc, list) for doc in relevant_docs):
-        relevant_docs = [item for sublist in relevant_docs for item in sublist]  # Flatten
-
-    # Ensure all elements are strings
-    relevant_docs = list(map(str, relevant_docs))
+    relevant_docs = retrieve_documents(query, top_k=3)  # Already a flat list of strings
 
     if relevant_docs:
         context = "\n".join(relevant_docs)